@@ -1,21 +1,39 @@
-import collections.abc
+import functools
+import hashlib
 import logging
 import os
 import subprocess
+import threading
 import time
 import typing as t
+import uuid
+import weakref
+#
+from concurrent.futures import ThreadPoolExecutor
 
 #
 import anndata
+import boto3
 import duckdb
+import h5py
 import numpy as np
 import numpy.typing as npt
 import matplotlib.pyplot as plt
+import numba
 import pandas as pd
 import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import scipy.sparse
 #
 from typing_extensions import override
+from pandas._libs.parsers import STR_NA_VALUES
 from pathlib import Path
+from boto3.s3.transfer import TransferConfig
+from botocore import UNSIGNED
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
 from pydantic import Field
@@ -31,10 +49,14 @@ PARCEL_META_DATA_KEY = "cell_metadata_with_parcellation_annotation"
 MERFISH_CCF_DATASET_KEY = "MERFISH-C57BL6J-638850-CCF"
 PARCELLATION_SUBSTRUCTURE = "parcellation_substructure"
 PARCELLATION_STRUCTURE = "parcellation_structure"
+# CCF meta columns used to compute the cell type ratios
+CCF_TYPE_COLUMNS = [
+    PARCELLATION_STRUCTURE, PARCELLATION_SUBSTRUCTURE, "class", "subclass"
+]
 # Column Names
 # Glut subclasses
 GLUT_IT_SUBCLASS_SETMAP = {
-    "IT-ENT": set(
+    "IT-ENT": frozenset(
         [
             "003 L5/6 IT TPE-ENT Glut",
             "008 L2/3 IT ENT Glut",
@@ -42,7 +64,7 @@ GLUT_IT_SUBCLASS_SETMAP = {
             "011 L2 IT ENT-po Glut",
         ]
     ),
-    "IT-CTX": set(
+    "IT-CTX": frozenset(
         [
             "004 L6 IT CTX Glut",
             "005 L5 IT CTX Glut",
@@ -50,7 +72,7 @@ GLUT_IT_SUBCLASS_SETMAP = {
             "007 L2/3 IT CTX Glut",
         ]
     ),
-    "IT-Other": set(
+    "IT-Other": frozenset(
         [
             "002 IT EP-CLA Glut",
             "010 IT AON-TT-DP Glut",
@@ -61,11 +83,12 @@ GLUT_IT_SUBCLASS_SETMAP = {
     ),
 }
 GLUT_SUBCLASS_SETMAP = {
-    "ET": set(["022 L5 ET CTX Glut"]),
-    "CT": set(["028 L6b/CT ENT Glut", "030 L6 CT CTX Glut", "031 CT SUB Glut"]),
-    "NP": set(["032 L5 NP CTX Glut", "033 NP SUB Glut", "034 NP PPP Glut"]),
-    "IT": set.union(*GLUT_IT_SUBCLASS_SETMAP.values()),
+    "ET": frozenset(["022 L5 ET CTX Glut"]),
+    "CT": frozenset(["028 L6b/CT ENT Glut", "030 L6 CT CTX Glut", "031 CT SUB Glut"]),
+    "NP": frozenset(["032 L5 NP CTX Glut", "033 NP SUB Glut", "034 NP PPP Glut"]),
+    "IT": frozenset().union(*GLUT_IT_SUBCLASS_SETMAP.values()),
 }
+GLUT_ALL_SUBCLASS_SETMAP = GLUT_SUBCLASS_SETMAP | GLUT_IT_SUBCLASS_SETMAP
 GLUT = "Glut"
 GLUT_TYPES = list(GLUT_SUBCLASS_SETMAP.keys())
 GLUT_IT_TYPES = list(GLUT_IT_SUBCLASS_SETMAP.keys())
@@ -73,11 +96,11 @@ GLUT_COLUMNS = [GLUT] + GLUT_TYPES + GLUT_IT_TYPES + ["Glut-Other"]
 #
 # GABA subclasses
 GABA_SUBCLASS_SETMAP = {
-    "Vip": set(["046 Vip Gaba"]),
-    "Pvalb": set(["051 Pvalb chandelier Gaba", "052 Pvalb Gaba"]),
-    "Sst": set(["053 Sst Gaba", "265 PB Sst Gly-Gaba"]),
-    "Lamp5": set(["049 Lamp5 Gaba", "050 Lamp5 Lhx6 Gaba"]),
-    "Sst-Chodl": set(["056 Sst Chodl Gaba"])
+    "Vip": frozenset(["046 Vip Gaba"]),
+    "Pvalb": frozenset(["051 Pvalb chandelier Gaba", "052 Pvalb Gaba"]),
+    "Sst": frozenset(["053 Sst Gaba", "265 PB Sst Gly-Gaba"]),
+    "Lamp5": frozenset(["049 Lamp5 Gaba", "050 Lamp5 Lhx6 Gaba"]),
+    "Sst-Chodl": frozenset(["056 Sst Chodl Gaba"])
 }
 GABA = "GABA"
 GABA_TYPES = list(GABA_SUBCLASS_SETMAP.keys())
@@ -86,12 +109,240 @@ GABA_COLUMNS = [GABA] + list(GABA_SUBCLASS_SETMAP.keys()) + ["GABA-Other"]
 FRACTION_COLUMN_FMT = "{} fraction"
 INHIBITORY_FRACTION_COLUMN = "inhibitory fraction"
 FRACTION_WI_REGION_COLUMN = "fraction wi. region"
+# Sub-types with a fraction column w.r.t. their GABA/Glut totals
+FRACTION_TYPES = GABA_TYPES + GLUT_IT_TYPES + GLUT_TYPES
+FRACTION_COLUMNS = [FRACTION_COLUMN_FMT.format(colx) for colx in FRACTION_TYPES]
+# Flag columns added by cell_meta_type_flags (in order); bit k of a cell's
+# flag word is set if the cell has the flag TYPE_FLAG_COLUMNS[k]
+TYPE_FLAG_COLUMNS = ["E", "I", "O"] + GABA_COLUMNS + GLUT_COLUMNS
+TYPE_FLAG_BITS = {flag_col: 1 << kx for kx, flag_col in enumerate(TYPE_FLAG_COLUMNS)}
+# Columns of the cell type ratio data frames (see cell_meta_type_ratios)
+DF_SCHEMA = {
+    "Region": pl.Utf8,
+    "Layer": pl.Utf8,
+    "nregion": pl.Int64,
+    INHIBITORY_FRACTION_COLUMN: pl.Float64,
+    FRACTION_WI_REGION_COLUMN: pl.Float64,
+} | {frac_col: pl.Float64 for frac_col in FRACTION_COLUMNS}
+#
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True,
+)
+# Expression matrices are tens of GBs each; fetch with larger ranged GETs
+S3_LARGE_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=32,
+    use_threads=True,
+)
 
 
 def _log():
     return logging.getLogger(__name__)
 
 
+# boto3 client creation on a shared session is not thread-safe; the
+# client is built from its own session, once, under the lock
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def _s3_client() -> t.Any:
+    with _S3_CLIENT_LOCK:
+        return _create_s3_client()
+
+
+@functools.lru_cache(maxsize=1)
+def _create_s3_client() -> t.Any:
+    return boto3.session.Session().client(
+        "s3",
+        config=Config(
+            signature_version=UNSIGNED,
+            max_pool_connections=64,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+        )
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _load_pcache(download_base: str) -> AbcProjectCache:
+    pcache = AbcProjectCache.from_s3_cache(download_base)
+    # Share the pooled client, instead of one new client per cache
+    if hasattr(pcache.cache, "_s3_client"):
+        pcache.cache._s3_client = _s3_client()
+    pcache.load_manifest()
+    return pcache
+
+
+# Time of the last manifest refresh of each project cache; a cache rebuilt
+# after _load_pcache.cache_clear() or eviction has no entry
+_PCACHE_REFRESH: weakref.WeakKeyDictionary[AbcProjectCache, float] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_pcache(download_base: str | Path) -> AbcProjectCache:
+    # Cache (and its parsed manifest) is shared across calls per download_base;
+    # use _load_pcache.cache_clear() to force a reload in long-running sessions
+    return _load_pcache(str(download_base))
+
+
+def _split_s3_uri(remote_path: str | Path) -> tuple[str, str]:
+    bucket, _, key = str(remote_path).removeprefix("s3://").partition("/")
+    return bucket, key
+
+
+def _read_csv_table(
+    csv_path: str | Path,
+    column_types: dict[str, pa.DataType] | None = None,
+    keep_default_na: bool = True,
+    columns: list[str] | None = None,
+) -> pa.Table:
+    # Multi-threaded pyarrow CSV parse; column_types are applied while
+    # parsing (pandas' pyarrow engine casts after inference, which drops
+    # leading zeros of string ids). Only the given columns (all, if None)
+    # are converted. As with pandas.read_csv, the NA strings are pandas'
+    # defaults (none if not keep_default_na), date-like columns stay
+    # strings and all-NA columns are float; missing strings are None
+    # rather than NaN in the data frame.
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        strings_can_be_null=keep_default_na,
+        include_columns=columns,
+        null_values=sorted(STR_NA_VALUES) if keep_default_na else [],
+    )
+    # Column types are inferred from the first block, as in read_csv
+    with pa_csv.open_csv(csv_path, convert_options=convert_options) as reader:
+        temporal_types = {
+            fx.name: pa.string()
+            for fx in reader.schema if pa.types.is_temporal(fx.type)
+        }
+    if temporal_types:
+        convert_options.column_types = {**(column_types or {}), **temporal_types}
+    csv_table = pa_csv.read_csv(csv_path, convert_options=convert_options)
+    for kx, fx in enumerate(csv_table.schema):
+        if pa.types.is_null(fx.type):
+            csv_table = csv_table.set_column(
+                kx, fx.name, csv_table.column(kx).cast(pa.float64())
+            )
+    return csv_table
+
+
+def _parquet_sidecar_path(
+    csv_path: str | Path,
+    column_types: dict[str, pa.DataType] | None = None,
+    keep_default_na: bool = True,
+    columns: list[str] | None = None,
+) -> Path:
+    # Sibling parquet file of csv_path for the given parse options and
+    # columns; the default options with all the columns use <name>.parquet,
+    # others <name>.<options hash>.parquet
+    csv_path = Path(csv_path)
+    if column_types is None and keep_default_na and not columns:
+        return csv_path.with_suffix(".parquet")
+    parse_opts = repr((
+        sorted((cx, str(tx)) for cx, tx in (column_types or {}).items()),
+        keep_default_na,
+        list(columns or []),
+    ))
+    opts_hash = hashlib.sha1(parse_opts.encode()).hexdigest()[:12]
+    return csv_path.with_suffix(f".{opts_hash}.parquet")
+
+
+def _parquet_sidecar(
+    csv_path: str | Path,
+    column_types: dict[str, pa.DataType] | None = None,
+    keep_default_na: bool = True,
+    columns: list[str] | None = None,
+) -> Path | None:
+    # Sibling parquet file of csv_path, if it is at least as new as the CSV
+    csv_path = Path(csv_path)
+    pq_path = _parquet_sidecar_path(
+        csv_path, column_types, keep_default_na, columns
+    )
+    if pq_path.exists() and pq_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return pq_path
+    return None
+
+
+def _write_parquet_sidecar(csv_table: pa.Table, pq_path: Path) -> None:
+    # Write to a temporary file in the same directory and move it in place,
+    # so that an interrupted write never leaves a partial sidecar
+    tmp_path = pq_path.with_name(f"{pq_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        pq.write_table(csv_table, tmp_path, compression="zstd")
+        os.replace(tmp_path, pq_path)
+    except (OSError, pa.ArrowException) as ex:
+        _log().warning("Failed to cache %s as parquet : %s", pq_path, ex)
+        tmp_path.unlink(missing_ok=True)
+
+
+def _read_csv_arrow(
+    csv_path: str | Path,
+    column_types: dict[str, pa.DataType] | None = None,
+    keep_default_na: bool = True,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    # The parsed CSV is cached as a sibling parquet file (one per set of
+    # parse options and columns), which is read instead of the CSV while it
+    # is at least as new as the CSV. A subset of columns is read from its
+    # own sidecar, else from the sidecar of all the columns; if neither is
+    # there, only those columns are parsed. An unreadable sidecar is removed
+    # and rebuilt.
+    csv_path = Path(csv_path)
+    sidecar_reads = [(columns, None)] if columns else []
+    sidecar_reads.append((None, columns))
+    for sidecar_columns, read_columns in sidecar_reads:
+        pq_path = _parquet_sidecar(
+            csv_path, column_types, keep_default_na, sidecar_columns
+        )
+        if pq_path is None:
+            continue
+        try:
+            # Columns missing from the sidecar are reported by the CSV parse
+            pq_names = set(pq.read_schema(pq_path).names)
+            if read_columns and not pq_names.issuperset(read_columns):
+                continue
+            return pq.read_table(pq_path, columns=read_columns).to_pandas()
+        except (OSError, pa.ArrowException) as ex:
+            _log().warning("Failed to read parquet %s : %s", pq_path, ex)
+            pq_path.unlink(missing_ok=True)
+    csv_table = _read_csv_table(csv_path, column_types, keep_default_na, columns)
+    _write_parquet_sidecar(
+        csv_table,
+        _parquet_sidecar_path(csv_path, column_types, keep_default_na, columns),
+    )
+    return csv_table.to_pandas()
+
+
+def _thread_map(
+    map_fn: t.Callable[..., t.Any],
+    args_list: list[tuple[t.Any, ...]],
+    max_workers: int | None,
+) -> list[t.Any]:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda fn_args: map_fn(*fn_args), args_list))
+
+
+def _manifest_directory_paths(
+    manifest: dict[str, t.Any],
+    download_base: str | Path,
+    dir_key: str
+) -> list[tuple[str, Path]]:
+    dir_paths = []
+    for r in manifest["directory_listing"]:
+        r_dict = manifest["directory_listing"][r]
+        if dir_key not in r_dict["directories"]:
+            continue
+        d_dict = r_dict["directories"][dir_key]
+        local_path = Path(download_base, d_dict["relative_path"])
+        remote_path = manifest["resource_uri"] + d_dict["relative_path"]
+        dir_paths.append((remote_path, local_path))
+    return dir_paths
+
+
 def abc_cache_download_meta(download_base: str | Path,
                             abc_data_key: str,
                             meta_key: str | None) -> str | Path | None:
@@ -118,8 +369,7 @@ def abc_cache_download_meta(download_base: str | Path,
        Cell meta data for each of the cell, with each row being a cell.
 
     """
-    pcache = AbcProjectCache.from_s3_cache(download_base)
-    pcache.load_manifest()
+    pcache = _get_pcache(download_base)
     if abc_data_key not in pcache.list_directories:
         _log().error(
             "Meta data directory not one of valid dirs %s ", pcache.list_directories
@@ -161,8 +411,7 @@ def abc_cache_download_exp_mat(download_base: str | Path,
        Cell meta data for each of the cell, with each row being a cell.
 
     """
-    pcache = AbcProjectCache.from_s3_cache(download_base)
-    pcache.load_manifest()
+    pcache = _get_pcache(download_base)
     if abc_data_key not in pcache.list_directories:
         _log().error(
             "Meta data directory not one of valid dirs %s ", pcache.list_directories
@@ -192,8 +441,7 @@ def abc_cache_download_all_meta_data(download_base: str | Path) -> None:
     list
         List of return values of the executions download commands.
     """
-    pcache = AbcProjectCache.from_s3_cache(download_base)
-    pcache.load_manifest()
+    pcache = _get_pcache(download_base)
     for rdir in pcache.list_directories:
         abc_cache_download_meta(download_base, rdir, None)
 
@@ -215,8 +463,7 @@ def download_merfish_manifest(
     manifest: dict
         manifest json as a dict
     """
-    pcache = AbcProjectCache.from_s3_cache(download_base)
-    pcache.load_manifest()
+    pcache = _get_pcache(download_base)
     manifest = pcache.cache._manifest.data
     return manifest
 
@@ -250,33 +497,46 @@ def merfish_files_meta(
 
 def aws_s3_copy(
     remote_path: str | Path,
-    local_path: str | Path
-) -> ProcessResult:
+    local_path: str | Path,
+    transfer_config: TransferConfig = S3_TRANSFER_CONFIG,
+) -> Path | None:
     """
-    Run aws s3 cp command from remote_path to local_path
+    Download the S3 object at remote_path to local_path with the boto3
+    transfer manager, using a shared unsigned client. Failed downloads are
+    logged and return None, so that one failure does not abort a batch.
 
     Parameters
     ----------
     remote_path : str | Path
-        Remove AWS path
+        Remote AWS path of the form s3://bucket/key
     local_path: str | Path
         Local path
+    transfer_config: TransferConfig (default: S3_TRANSFER_CONFIG)
+        Multipart chunk size and concurrency used for the download
 
     Returns
     -------
-    subprocess.CompletedProcess
-        Return value of the aws download command.
+    Path | None
+        Local path of the downloaded file; None if the download failed.
 
     """
-    # Download command
-    command = "aws s3 cp --no-sign-request %s %s" % (remote_path, local_path)
-    print(command)
-    # Run download command
-    start = time.process_time()
-    # Uncomment to download file
-    result = subprocess.run(command.split(" "), stdout=subprocess.PIPE)
-    print("time taken: ", time.process_time() - start)
-    return result
+    bucket, key = _split_s3_uri(remote_path)
+    local_path = Path(local_path)
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    _log().debug("Download %s -> %s", remote_path, local_path)
+    start = time.perf_counter()
+    try:
+        _s3_client().download_file(
+            Bucket=bucket,
+            Key=key,
+            Filename=str(local_path),
+            Config=transfer_config,
+        )
+    except (ClientError, BotoCoreError) as ex:
+        _log().error("Failed to download %s : %s", remote_path, ex)
+        return None
+    _log().debug("Download %s : %.2fs", remote_path, time.perf_counter() - start)
+    return local_path
 
 
 def aws_s3_sync(
@@ -296,17 +556,29 @@ def aws_s3_sync(
     Returns
     -------
     subprocess.CompletedProcess
-        Return value of the aws download command.
+        Return value of the aws download command; stdout is discarded and
+        stderr is captured.
 
     """
-    command_pattern = "aws s3 sync --no-sign-request %s %s"
-    command = command_pattern % (remote_path, local_path)
-    print(command)
-    #
-    start = time.process_time()
-    # Uncomment to download directories
-    result = subprocess.run(command.split(), stdout=subprocess.PIPE)
-    print("time taken: ", time.process_time() - start)
+    argv = [
+        "aws", "s3", "sync", "--no-sign-request", str(remote_path), str(local_path)
+    ]
+    _log().debug("Run : %s", argv)
+    start = time.perf_counter()
+    result = subprocess.run(
+        argv,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if result.returncode != 0:
+        _log().error(
+            "aws s3 sync %s failed [%d] : %s",
+            remote_path,
+            result.returncode,
+            result.stderr.decode(errors="replace"),
+        )
+    _log().debug("Sync %s : %.2fs", remote_path, time.perf_counter() - start)
     return result
 
 
@@ -314,12 +586,11 @@ def aws_download_file(
     download_base: str | Path,
     manifest: dict[str, dict[str, t.Any]],
     file_dict: dict[str, t.Any],
-) -> ProcessResult:
+    transfer_config: TransferConfig = S3_TRANSFER_CONFIG,
+) -> Path | None:
     """
-    Given a file entry in manifest, download the file using AWS CLI 'aws'
+    Given a file entry in manifest, download the file with boto3
     to the relative path constructed from the download_base.
-    Assumes that the aws command is available is installed in the current
-    environment.
 
     A simple file entry in manifest is as follows:
     {
@@ -348,18 +619,24 @@ def aws_download_file(
     download_base : str
         Base directory on to which the file will be downloaded in the relative
         path.
+    transfer_config: TransferConfig (default: S3_TRANSFER_CONFIG)
+        Multipart chunk size and concurrency used for the download
 
     Returns
     -------
-    subprocess.CompletedProcess
-        Return value of the aws download command.
+    Path | None
+        Local path of the downloaded file; None if the download failed.
 
     """
-    print(file_dict["relative_path"], file_dict["size"])
+    _log().debug("File %s : %s bytes", file_dict["relative_path"], file_dict["size"])
     local_path = os.path.join(download_base, file_dict["relative_path"])
     local_path = Path(local_path)
     remote_path = manifest["resource_uri"] + file_dict["relative_path"]
-    return aws_s3_copy(remote_path, local_path)
+    return aws_s3_copy(remote_path, local_path, transfer_config)
+
+
+# Download sizes keyed by (resource_uri, version) of the manifest
+_DOWNLOAD_SIZE_CACHE: dict[tuple[str, str], dict[str, float]] = {}
 
 
 def download_size(
@@ -367,7 +644,8 @@ def download_size(
 ) -> dict[str, float]:
     """
     Construct a dictionary containing the file sizes in GB given in the
-    manifest
+    manifest. The sizes are cached for manifests with a version, so repeated
+    calls on the same manifest do not walk the directory listing again.
 
     Parameters
     ----------
@@ -379,22 +657,37 @@ def download_size(
     dict
         A dictionary containing the file sizes in GB of each of the files.
     """
+    cache_key = (manifest.get("resource_uri"), manifest.get("version"))
+    if cache_key[1] is not None and cache_key in _DOWNLOAD_SIZE_CACHE:
+        return dict(_DOWNLOAD_SIZE_CACHE[cache_key])
     to_gb = float(float(1024) ** 3)
     #
     file_size_dict = {}
-    for r in manifest["directory_listing"]:
-        r_dict = manifest["directory_listing"][r]
-        for d in r_dict["directories"]:
-            d_dict = r_dict["directories"][d]
-            file_gb = d_dict["total_size"] / to_gb
-            print(d_dict["relative_path"], ":", "%0.2f GB" % (file_gb))
-            file_size_dict[d_dict["relative_path"]] = file_gb
-    return file_size_dict
+    for r_dict in manifest["directory_listing"].values():
+        for d_dict in r_dict["directories"].values():
+            file_size_dict[d_dict["relative_path"]] = d_dict["total_size"] / to_gb
+    if cache_key[1] is not None:
+        _DOWNLOAD_SIZE_CACHE[cache_key] = file_size_dict
+    return dict(file_size_dict)
+
+
+def print_download_sizes(file_size_dict: dict[str, float]) -> None:
+    """
+    Print the file sizes returned by download_size, one line per file.
+
+    Parameters
+    ----------
+    file_size_dict : dict
+        A dictionary of file sizes in GB, as returned by download_size.
+    """
+    for rel_path, file_gb in file_size_dict.items():
+        print(rel_path, ":", "%0.2f GB" % (file_gb))
 
 
 def aws_download_meta_data(
     manifest: dict[str, t.Any],
-    download_base: str | Path
+    download_base: str | Path,
+    max_workers: int = 16,
 )-> list[ProcessResult]:
     """
     Download all the metadata files using AWS CLI listed in the manifest to
@@ -407,27 +700,16 @@ def aws_download_meta_data(
         manifest json as a dict.
     download_base: str
         Directory to which meta data is to be downloaded
+    max_workers: int (default: 16)
+        Maximum number of directories synced concurrently
 
     Returns
     -------
     list
         List of return values of the executions download commands.
     """
-    download_results = []
-    for r in manifest["directory_listing"]:
-        r_dict = manifest["directory_listing"][r]
-        for d in r_dict["directories"]:
-            #
-            if d != "metadata":
-                continue
-            d_dict = r_dict["directories"][d]
-            local_path = os.path.join(download_base, d_dict["relative_path"])
-            local_path = Path(local_path)
-            remote_path = manifest["resource_uri"] + d_dict["relative_path"]
-            #
-            result = aws_s3_sync(remote_path, local_path)
-            download_results.append(result)
-    return download_results
+    sync_paths = _manifest_directory_paths(manifest, download_base, "metadata")
+    return _thread_map(aws_s3_sync, sync_paths, max_workers)
 
 
 def abc_cache_download_abc_exp_matrices(
@@ -468,7 +750,8 @@ def aws_download_abc_exp_matrices(
     download_base: Path,
     manifest : dict[str, t.Any],
     dataset_exp_keys: dict[str, str] | None = None,
-) -> list[ProcessResult]:
+    max_workers: int = 2,
+) -> list[Path | None]:
     """
     Download the genes expression matrices listed in the dataset_exp_keys
     from the location described by the manifest to download_base location.
@@ -481,11 +764,15 @@ def aws_download_abc_exp_matrices(
         manifest json as a dict.
     download_exp_keys: dict[str, str]
         Dictonary of the database key mapping to the entry keys
+    max_workers: int (default: 2)
+        Maximum number of files downloaded concurrently; each file is
+        itself fetched as concurrent ranged GETs (S3_LARGE_TRANSFER_CONFIG)
 
     Returns
     -------
     list
-        List of return values of the executions download commands.
+        List of local paths of the downloaded files; None for the files
+        that failed to download (the failures are logged).
     """
     if dataset_exp_keys is None:
         dataset_exp_keys = {
@@ -496,22 +783,27 @@ def aws_download_abc_exp_matrices(
             "Zhuang-ABCA-3": "Zhuang-ABCA-3",
             "Zhuang-ABCA-4": "Zhuang-ABCA-4"
         }
-    download_results = []
-    start = time.process_time()
+    download_args = []
+    start = time.perf_counter()
     # Downloading data Expresssion matrices
     for d, lk in dataset_exp_keys.items():
         exp_matrices = manifest["file_listing"][d]["expression_matrices"]
         file_dict = exp_matrices[lk]["log2"]["files"]["h5ad"]
-        print("size:", file_dict["size"])
-        result = aws_download_file(download_base, manifest, file_dict)
-        download_results.append(result)
-    print("time taken: ", time.process_time() - start)
+        _log().debug("Expression matrix %s : %s bytes", lk, file_dict["size"])
+        download_args.append(
+            (download_base, manifest, file_dict, S3_LARGE_TRANSFER_CONFIG)
+        )
+    download_results = _thread_map(aws_download_file, download_args, max_workers)
+    _log().debug(
+        "Download expression matrices : %.2fs", time.perf_counter() - start
+    )
     return download_results
 
 
 def aws_download_image_volumes(
     download_base: str | Path,
     manifest: dict[str, t.Any],
+    max_workers: int = 16,
 ) -> list[ProcessResult]:
     """
     Download all the image volumes listed in the manifest to download_base
@@ -522,25 +814,16 @@ def aws_download_image_volumes(
         manifest json as a dict.
     download_base: str
         Directory to which meta data is to be downloaded
+    max_workers: int (default: 16)
+        Maximum number of directories synced concurrently
 
     Returns
     -------
     list
         List of return values of the executions download commands.
     """
-    download_results = []
-    for r in manifest["directory_listing"]:
-        r_dict = manifest["directory_listing"][r]
-        for d in r_dict["directories"]:
-            if d != "image_volumes":
-                continue
-            d_dict = r_dict["directories"][d]
-            local_path = os.path.join(download_base, d_dict["relative_path"])
-            local_path = Path(local_path)
-            remote_path = manifest["resource_uri"] + d_dict["relative_path"]
-            result = aws_s3_sync(remote_path, local_path)
-            download_results.append(result)
-    return download_results
+    sync_paths = _manifest_directory_paths(manifest, download_base, "image_volumes")
+    return _thread_map(aws_s3_sync, sync_paths, max_workers)
 
 
 def download_abc_data(
@@ -597,7 +880,7 @@ def taxonomy_meta(
     metadata_path = abc_cache_download_meta(download_base, abc_data_key, meta_key)
     if metadata_path is None:
         return None
-    taxnm_meta_df = pd.read_csv(metadata_path, keep_default_na=False)
+    taxnm_meta_df = _read_csv_arrow(metadata_path, keep_default_na=False)
     if "cluster_alias" in taxnm_meta_df.columns:
         taxnm_meta_df.set_index("cluster_alias", inplace=True)
     return taxnm_meta_df
@@ -665,7 +948,7 @@ def cell_metadata(
     )
     if metadata_path is None:
         return None
-    cell_df = pd.read_csv(metadata_path, dtype={"cell_label": str})
+    cell_df = _read_csv_arrow(metadata_path, {"cell_label": pa.string()})
     cell_df.set_index("cell_label", inplace=True)
     return cell_df
 
@@ -694,7 +977,7 @@ def gene_metadata(
     metadata_path = abc_cache_download_meta(download_base, abc_data_key, "gene")
     if metadata_path is None:
         return None
-    gene_df = pd.read_csv(metadata_path)
+    gene_df = _read_csv_arrow(metadata_path)
     gene_df.set_index("gene_identifier", inplace=True)
     return gene_df
 
@@ -719,6 +1002,99 @@ def gene_expression_matrix(
     adata = anndata.read_h5ad(data_file, backed="r")
     return adata
 
+
+def _h5ad_index(h5_group: h5py.Group) -> npt.NDArray[np.object_]:
+    return h5_group[h5_group.attrs.get("_index", "_index")].asstr()[:]
+
+
+def _h5ad_read_columns(
+    h5_x: h5py.Dataset | h5py.Group,
+    col_idx: npt.NDArray[np.intp],
+    n_cols: int,
+    block_size: int,
+) -> NDFloatArray:
+    # Columns col_idx (sorted) of X, for all the rows
+    if isinstance(h5_x, h5py.Dataset):
+        return h5_x[:, col_idx]
+    indptr = h5_x["indptr"][:]
+    match h5_x.attrs["encoding-type"]:
+        case "csc_matrix":
+            n_rows = h5_x.attrs["shape"][0]
+            out_arr = np.zeros((n_rows, len(col_idx)), dtype=h5_x["data"].dtype)
+            for kx, cx in enumerate(col_idx):
+                start, stop = indptr[cx], indptr[cx + 1]
+                out_arr[h5_x["indices"][start:stop], kx] = h5_x["data"][start:stop]
+            return out_arr
+        case _:
+            # csr_matrix : read the rows in blocks and keep only the columns
+            row_blocks = []
+            for rstart in range(0, len(indptr) - 1, block_size):
+                rstop = min(rstart + block_size, len(indptr) - 1)
+                start, stop = indptr[rstart], indptr[rstop]
+                block_mat = scipy.sparse.csr_matrix(
+                    (
+                        h5_x["data"][start:stop],
+                        h5_x["indices"][start:stop],
+                        indptr[rstart:rstop + 1] - start,
+                    ),
+                    shape=(rstop - rstart, n_cols),
+                )
+                row_blocks.append(block_mat[:, col_idx].toarray())
+            return np.vstack(row_blocks)
+
+
+def gene_expression_subset(
+    data_file : str | Path,
+    gene_ids: list[str] | pd.Index,
+    block_size: int = 100000,
+) -> pd.DataFrame:
+    """
+    Expression values of the genes gene_ids (identifiers in the var index)
+    for all the cells in the h5ad data_file, with the cells as rows and
+    gene_ids as columns.
+
+    Only the selected gene columns of X are read, directly with h5py;
+    X can be dense or a CSR/CSC sparse matrix (read in row blocks of
+    block_size). Use gene_expression_matrix for the full AnnData object.
+    """
+    with h5py.File(data_file, "r") as h5_file:
+        var_names = pd.Index(_h5ad_index(h5_file["var"]))
+        gene_idx = var_names.get_indexer(gene_ids)
+        if (gene_idx < 0).any():
+            raise KeyError(
+                f"Genes not found in {data_file}: "
+                f"{list(pd.Index(gene_ids)[gene_idx < 0])}"
+            )
+        # h5py reads want strictly increasing indices : read each gene once
+        # and expand to the order (and repeats) of gene_ids afterwards
+        uniq_idx, inv_idx = np.unique(gene_idx, return_inverse=True)
+        expr_arr = _h5ad_read_columns(
+            h5_file["X"], uniq_idx, len(var_names), block_size
+        )
+        obs_names = _h5ad_index(h5_file["obs"])
+    expr_arr = expr_arr[:, inv_idx.ravel()]
+    return pd.DataFrame(expr_arr, index=obs_names, columns=gene_ids)
+
+
+def gene_expression_dataframe(
+    download_base : str | Path,
+    gene_meta: pd.DataFrame,
+    source : str = "MERFISH-C57BL6J-638850",
+    file_id: str = "C57BL6J-638850/log2",
+) -> pd.DataFrame | None:
+    """
+    Gene expression data frame of the genes in gene_meta, with the gene
+    symbols as columns, read from the expression matrix file_id (see
+    gene_expression_matrix) without loading the other genes.
+    """
+    data_file = abc_cache_download_exp_mat(download_base, source, file_id)
+    if data_file is None:
+        return None
+    gdata = gene_expression_subset(data_file, gene_meta.index)
+    gdata.columns = gene_meta.gene_symbol
+    return gdata
+
+
 def plot_section(
     xx: NDFloatArray,
     yy: NDFloatArray,
@@ -761,9 +1137,62 @@ def create_expression_dataframe(
     return joined
 
 
+def iter_expression_dataframe(
+    adata: anndata.AnnData,
+    gene_meta: pd.DataFrame,
+    section_meta : pd.DataFrame,
+    chunk_size: int = 100000,
+) -> t.Iterator[pd.DataFrame]:
+    """
+    Gene expression data frame as in create_expression_dataframe, generated
+    in blocks of chunk_size rows of section_meta so that only one block of
+    the expression matrix is held in memory at a time.
+    """
+    obs_pos = adata.obs_names.get_indexer(section_meta.index)
+    for start in range(0, len(section_meta), chunk_size):
+        section_chunk = section_meta.iloc[start:start + chunk_size]
+        chunk_pos = obs_pos[start:start + chunk_size]
+        # Backed (h5) reads want sorted row positions; join restores the order
+        chunk_pos = np.sort(chunk_pos[chunk_pos >= 0])
+        gdata = adata[chunk_pos, gene_meta.index].to_df()
+        gdata.columns = gene_meta.gene_symbol
+        yield section_chunk.join(gdata)
+
+
+def write_expression_parquet(
+    adata: anndata.AnnData,
+    gene_meta: pd.DataFrame,
+    section_meta : pd.DataFrame,
+    out_file: str | Path,
+    chunk_size: int = 100000,
+) -> None:
+    """
+    Write the gene expression data frame (see iter_expression_dataframe)
+    to a single parquet file, one row group per block.
+    """
+    pq_writer = None
+    try:
+        for chunk_df in iter_expression_dataframe(
+            adata, gene_meta, section_meta, chunk_size
+        ):
+            if pq_writer is None:
+                chunk_table = pa.Table.from_pandas(chunk_df)
+                pq_writer = pq.ParquetWriter(
+                    out_file, chunk_table.schema, compression="zstd"
+                )
+            else:
+                chunk_table = pa.Table.from_pandas(
+                    chunk_df, schema=pq_writer.schema
+                )
+            pq_writer.write_table(chunk_table)
+    finally:
+        if pq_writer is not None:
+            pq_writer.close()
+
+
 def aggregate_by_metadata(
     df: pd.DataFrame,
-    gnames: list[str],
+    gnames: list[str] | pd.Series | pd.Index,
     group_value: str,
     sort: bool=False
 )-> pd.DataFrame:
@@ -771,9 +1200,37 @@ def aggregate_by_metadata(
     Aggregate gene expression by 'group_value' and report the average gene
     expression values of the list of genes given by 'gnames'
     """
-    grouped : pd.DataFrame = df.groupby(
-        group_value
-    )[gnames].mean() # pyright: ignore[reportAssignmentType]
+    gnames = list(gnames)
+    # DuckDB column names are case-insensitive, so only the needed columns
+    # are registered, under the positional aliases c0 (group), c1, ... cn
+    expr_df = df[[group_value] + gnames]
+    expr_df.columns = [f"c{kx}" for kx in range(len(gnames) + 1)]
+    gcols = expr_df.columns[1:]
+    avg_cols = ", ".join(f"avg(CAST({gx} AS DOUBLE)) AS {gx}" for gx in gcols)
+    with duckdb.connect() as db_conn:
+        db_conn.register("expr_df", expr_df)
+        grouped = db_conn.execute(
+            f"SELECT c0, {avg_cols} FROM expr_df "
+            f"WHERE c0 IS NOT NULL GROUP BY c0 ORDER BY c0"
+        ).df()
+    # Restore the names, and the dtypes of float gene columns (avg is double)
+    grouped = grouped.set_index("c0")
+    grouped.index.name = group_value
+    grouped.columns = gnames
+    grouped = grouped.astype({
+        gx: dtype for gx, dtype in zip(gnames, df[gnames].dtypes)
+        if pd.api.types.is_float_dtype(dtype)
+    })
+    group_dtype = df[group_value].dtype
+    if isinstance(group_dtype, pd.CategoricalDtype):
+        # As groupby : all the categories, in category order, in the
+        # categorical dtype of the input (DuckDB returns an ordered ENUM)
+        grouped.index = pd.Index(grouped.index.astype(object), name=group_value)
+        grouped = grouped.reindex(
+            pd.CategoricalIndex(
+                group_dtype.categories, dtype=group_dtype, name=group_value
+            )
+        )
     if sort:
         grouped = grouped.sort_values(by=gnames[0], ascending=False)
     return grouped
@@ -791,7 +1248,8 @@ def plot_heatmap(
     """
     Plot Heat Map based on the input data frame
     """
-    arr = df.to_numpy()
+    # float32 is ample for color mapping and halves the image buffer
+    arr = df.to_numpy(dtype=np.float32)
     sub_plots : tuple[Figure, Axes] = plt.subplots()
     fig, ax = sub_plots
     fig.set_size_inches(
@@ -806,40 +1264,67 @@ def plot_heatmap(
         vmax=lmax)
     xlabs = df.columns.values
     ylabs = df.index.values
-    ax.set_xticks(range(len(xlabs)))
-    ax.set_xticklabels(xlabs)
-    ax.set_yticks(range(len(ylabs)))
-    ax.set_yticklabels(ylabs)
-    plt.setp(ax.get_xticklabels(), rotation=90)
+    ax.set_xticks(np.arange(len(xlabs)), labels=xlabs, rotation=90)
+    ax.set_yticks(np.arange(len(ylabs)), labels=ylabs)
     cbar = ax.figure.colorbar(im, ax=ax)
     cbar.set_label(ylabel)
     return im
 
 
-def cell_ccf_meta(ccf_meta_file: str | Path) -> pd.DataFrame:
+def cell_ccf_meta(
+    ccf_meta_file: str | Path,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
     """
-    Data frame containing the Cell Allen CCF Meta
+    Data frame containing the Cell Allen CCF Meta; if columns is given, only
+    those columns are loaded. The CSV (or the columns of it) is converted to
+    a sibling parquet file on the first load, which is read by the later
+    loads.
     """
-    cell_ccf = pd.read_csv(ccf_meta_file)
+    cell_ccf = _read_csv_arrow(ccf_meta_file, columns=columns)
     return cell_ccf
 
 
-def valid_genes_symbols(gene_meta: pd.DataFrame) -> list[str]:
+# Parsed CCF meta files, keyed by the path and modification time so that an
+# updated file is read again. Only the columns needed for the cell type
+# ratios are kept.
+@functools.lru_cache(maxsize=4)
+def _load_ccf(ccf_meta_file: str, mtime: float) -> pd.DataFrame:
+    cell_ccf = cell_ccf_meta(ccf_meta_file, CCF_TYPE_COLUMNS)
+    # Region filters and groupby work on the integer category codes
+    for colx in (PARCELLATION_STRUCTURE, PARCELLATION_SUBSTRUCTURE):
+        cell_ccf[colx] = cell_ccf[colx].astype("category")
+    # Flags are computed once here, instead of once per query
+    return cell_meta_type_flags(cell_ccf)
+
+
+def cached_cell_ccf_meta(ccf_meta_file: str | Path) -> pd.DataFrame:
+    """
+    Data frame containing the columns of Cell Allen CCF Meta needed for the
+    cell type ratios (CCF_TYPE_COLUMNS) along with the flags of
+    cell_meta_type_flags, computed once per version of the file and shared
+    between the callers; it should not be modified.
+    """
+    ccf_meta_file = Path(ccf_meta_file)
+    return _load_ccf(str(ccf_meta_file), ccf_meta_file.stat().st_mtime)
+
+
+def valid_genes_symbols(gene_meta: pd.DataFrame) -> npt.NDArray[np.object_]:
     """
     Genes that doesn't contain 'Blank'
     """
-    return gene_meta[~gene_meta.gene_symbol.str.contains("Blank")].gene_symbol.values
+    blank_genes = gene_meta.gene_symbol.str.contains("Blank", regex=False)
+    return gene_meta.loc[~blank_genes, "gene_symbol"].to_numpy()
 
 
 def filter_invalid_genes(
     gene_meta: pd.DataFrame,
-    valid_genes: list[str] | set[str]):
+    valid_genes: list[str] | set[str] | npt.NDArray[np.object_]):
     """
     Select the valid genes
     """
     # Remove "blank" genes
-    pred = [x in valid_genes for x in gene_meta.gene_symbol]
-    gf = gene_meta[pred]
+    gf = gene_meta[gene_meta.gene_symbol.isin(valid_genes)]
     return gf
 
 
@@ -854,17 +1339,24 @@ def predicate_flags_df(area_cell_df: pd.DataFrame,
     based on whether the class of the cell property "class"
     ends with "Glut" (E) or "GABA" (I)
     """
-    pred_dct = {
-        flag_column : pred_fn(
-            area_cell_df[select_col], # pyright: ignore[reportArgumentType]
+    flag_columns = list(flag_key_map.keys())
+    if exclude_column:
+        flag_columns.append(exclude_column)
+    # Fill one column-major bool block, wrapped as the data frame w/o copy
+    pred_arr = np.empty(
+        (len(area_cell_df), len(flag_columns)), dtype=bool, order="F"
+    )
+    select_series = area_cell_df[select_col]
+    for kx, flag_key in enumerate(flag_key_map.values()):
+        pred_arr[:, kx] = pred_fn(
+            select_series, # pyright: ignore[reportArgumentType]
             flag_key
-        )
-        for flag_column, flag_key in flag_key_map.items()
-    }
-    pred_df = pd.DataFrame(pred_dct)
+        ).to_numpy(dtype=bool, na_value=False)
     if exclude_column:
-        pred_df.loc[:, exclude_column] = ~pred_df.any(axis=1)
-    return pred_df
+        pred_arr[:, -1] = ~pred_arr[:, :-1].any(axis=1)
+    return pd.DataFrame(
+        pred_arr, columns=flag_columns, index=area_cell_df.index, copy=False
+    )
 
 
 def concat_predicate_flags_df(
@@ -876,7 +1368,8 @@ def concat_predicate_flags_df(
 ) -> pd.DataFrame:
     pred_df = predicate_flags_df(area_cell_df, flag_key_map,
                                  select_col, pred_fn, exclude_column)
-    return pd.concat([area_cell_df, pred_df], axis=1)
+    # Only flag columns are new; the meta data columns need not be copied
+    return pd.concat([area_cell_df, pred_df], axis=1, copy=False)
 
 
 def cell_meta_ei_flags(area_cell_df: pd.DataFrame):
@@ -895,13 +1388,16 @@ def cell_meta_ei_flags(area_cell_df: pd.DataFrame):
 
 def cell_meta_subclass_flags(
     area_cell_df: pd.DataFrame,
-    subclass_mapset: dict[str, set[str]]
+    subclass_mapset: dict[str, frozenset[str]]
 ) -> dict[str, pd.Series]:
+    # Scan the subclass column once; membership of each group is then
+    # evaluated on the (small) vocabulary and gathered by the codes.
+    # Code -1 (missing subclass) picks the trailing False.
+    codes, uniques = pd.factorize(area_cell_df["subclass"])
     pred_subclass = {}
     for kx, subx in subclass_mapset.items():
-        pred_subclass[kx] = (
-            area_cell_df["subclass"].isin(subx) # pyright: ignore[reportArgumentType]
-        )
+        in_subx = np.append(uniques.isin(subx), False)
+        pred_subclass[kx] = pd.Series(in_subx[codes], index=area_cell_df.index)
     return pred_subclass
 
 
@@ -917,7 +1413,9 @@ def cell_meta_gaba_flags(area_cell_df: pd.DataFrame):
     for kv, pred_series in pred_gaba_subclass_map.items():
         area_cell_df.loc[:, kv] = pred_series
     gaba_classifieds = ["Vip", "Pvalb", "Sst", "Sst-Chodl", "Lamp5"]
-    pred_gaba_classified = area_cell_df.loc[:, gaba_classifieds].any(axis="columns")
+    pred_gaba_classified = np.logical_or.reduce(
+        [pred_gaba_subclass_map[kv].to_numpy() for kv in gaba_classifieds]
+    )
     area_cell_df.loc[:, "GABA-Other"] = pred_gaba & (~pred_gaba_classified)
     return area_cell_df
 
@@ -928,25 +1426,103 @@ def cell_meta_glut_flags(area_cell_df: pd.DataFrame):
     # Glut Sub-types
     pred_glut = area_cell_df["subclass"].str.endswith("Glut")
     pred_glut_subclass_map = cell_meta_subclass_flags(
-        area_cell_df, GLUT_SUBCLASS_SETMAP | GLUT_IT_SUBCLASS_SETMAP
+        area_cell_df, GLUT_ALL_SUBCLASS_SETMAP
     )
     area_cell_df.loc[:, "Glut"] = pred_glut
     for kv, pred_series in pred_glut_subclass_map.items():
         area_cell_df.loc[:, kv] = pred_series
     glut_classifieds = ["ET", "CT", "IT", "NP"]
-    pred_glut_classified = area_cell_df.loc[:, glut_classifieds].any(axis="columns")
+    pred_glut_classified = np.logical_or.reduce(
+        [pred_glut_subclass_map[kv].to_numpy() for kv in glut_classifieds]
+    )
     area_cell_df.loc[:, "Glut-Other"] = pred_glut & (~pred_glut_classified)
     return area_cell_df
 
 
+@functools.lru_cache(maxsize=None)
+def _class_flag_word(cell_class: str) -> int:
+    if cell_class.endswith("Glut"):
+        return TYPE_FLAG_BITS["E"]
+    if cell_class.endswith("GABA"):
+        return TYPE_FLAG_BITS["I"]
+    return TYPE_FLAG_BITS["O"]
+
+
+@functools.lru_cache(maxsize=None)
+def _subclass_flag_word(subclass: str) -> int:
+    def group_word(setmap: dict[str, frozenset[str]]) -> int:
+        flag_word = 0
+        for kx, subx in setmap.items():
+            if subclass in subx:
+                flag_word |= TYPE_FLAG_BITS[kx]
+        return flag_word
+    #
+    gaba_word = group_word(GABA_SUBCLASS_SETMAP)
+    glut_word = group_word(GLUT_ALL_SUBCLASS_SETMAP)
+    flag_word = gaba_word | glut_word
+    if subclass.endswith("Gaba"):
+        flag_word |= TYPE_FLAG_BITS[GABA]
+        if gaba_word == 0:
+            flag_word |= TYPE_FLAG_BITS["GABA-Other"]
+    if subclass.endswith("Glut"):
+        flag_word |= TYPE_FLAG_BITS[GLUT]
+        if not any(subclass in GLUT_SUBCLASS_SETMAP[kx] for kx in GLUT_TYPES):
+            flag_word |= TYPE_FLAG_BITS["Glut-Other"]
+    return flag_word
+
+
+# Flag columns of each cell from the flag words of its class and subclass;
+# flag_arr is (n_flags, n_cells) so that each flag column is contiguous.
+# The code -1 (missing value) picks the trailing word of the word arrays.
+@numba.njit(parallel=True, cache=True)
+def _decode_flag_words(
+    class_codes: npt.NDArray[np.intp],
+    class_words: npt.NDArray[np.uint32],
+    subclass_codes: npt.NDArray[np.intp],
+    subclass_words: npt.NDArray[np.uint32],
+    flag_bits: npt.NDArray[np.uint32],
+    flag_arr: npt.NDArray[np.bool_],
+) -> None:
+    for ix in numba.prange(class_codes.shape[0]):
+        flag_word = class_words[class_codes[ix]] | subclass_words[subclass_codes[ix]]
+        for kx in range(flag_bits.shape[0]):
+            flag_arr[kx, ix] = (flag_word & flag_bits[kx]) != 0
+
+
 def cell_meta_type_flags(area_cell_df: pd.DataFrame):
-    return cell_meta_glut_flags(
-        cell_meta_gaba_flags(
-            cell_meta_ei_flags(
-                area_cell_df
-            )
-        )
+    """
+    Cell meta data frame with the flag columns TYPE_FLAG_COLUMNS added, i.e.,
+    the flags of cell_meta_ei_flags, cell_meta_gaba_flags and
+    cell_meta_glut_flags, computed in a single pass over class and subclass.
+    """
+    # Flag word of each distinct class/subclass, gathered by the codes;
+    # the trailing word is for the code -1 (missing value)
+    class_codes, class_uniques = pd.factorize(area_cell_df["class"])
+    class_words = np.array(
+        [_class_flag_word(cx) for cx in class_uniques] + [TYPE_FLAG_BITS["O"]],
+        dtype=np.uint32,
     )
+    subclass_codes, subclass_uniques = pd.factorize(area_cell_df["subclass"])
+    subclass_words = np.array(
+        [_subclass_flag_word(sx) for sx in subclass_uniques] + [0],
+        dtype=np.uint32,
+    )
+    flag_arr = np.empty((len(TYPE_FLAG_BITS), len(area_cell_df)), dtype=np.bool_)
+    _decode_flag_words(
+        class_codes,
+        class_words,
+        subclass_codes,
+        subclass_words,
+        np.array(list(TYPE_FLAG_BITS.values()), dtype=np.uint32),
+        flag_arr,
+    )
+    flags_df = pd.DataFrame(
+        flag_arr.T,
+        index=area_cell_df.index,
+        columns=list(TYPE_FLAG_BITS),
+        copy=False,
+    )
+    return pd.concat([area_cell_df, flags_df], axis=1)
 
 
 def cell_meta_type_ratios(
@@ -957,52 +1533,61 @@ def cell_meta_type_ratios(
     ratio_df = pd.DataFrame(index=area_sumdf.index)
     #
     ratio_df["Region"] = ax
-    ratio_df["Layer"] = [x.replace(ax, "") for x in ratio_df.index]
+    ratio_df["Layer"] = ratio_df.index.str.replace(ax, "", regex=False)
     ratio_df["nregion"] = nregion
     ratio_df[INHIBITORY_FRACTION_COLUMN] = area_sumdf["I"] / area_sumdf["EI"]
     ratio_df[FRACTION_WI_REGION_COLUMN] = area_sumdf["T"] / nregion
-    #
-    for colx in GABA_TYPES:
-        fraction_col = FRACTION_COLUMN_FMT.format(colx)
-        ratio_df[fraction_col] = area_sumdf[colx] / area_sumdf[GABA]
-    #
-    for colx in GLUT_IT_TYPES:
-        fraction_col = FRACTION_COLUMN_FMT.format(colx)
-        ratio_df[fraction_col] = area_sumdf[colx] / area_sumdf[GLUT]
-    #
-    for colx in GLUT_TYPES:
-        fraction_col = FRACTION_COLUMN_FMT.format(colx)
-        ratio_df[fraction_col] = area_sumdf[colx] / area_sumdf[GLUT]
-    return ratio_df
+    # Sub-type fractions w.r.t. the GABA/Glut totals : one broadcast division
+    # of the sub-type counts by their group totals, repeated per column
+    type_counts = area_sumdf[FRACTION_TYPES].to_numpy(dtype=np.float64)
+    group_totals = np.repeat(
+        area_sumdf[[GABA, GLUT]].to_numpy(dtype=np.float64),
+        [len(GABA_TYPES), len(GLUT_IT_TYPES) + len(GLUT_TYPES)],
+        axis=1,
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac_arr = type_counts / group_totals
+    frac_df = pd.DataFrame(
+        frac_arr,
+        index=ratio_df.index,
+        columns=FRACTION_COLUMNS,
+    )
+    return pd.concat([ratio_df, frac_df], axis=1)
 
 def region_ccf_cell_types(
     cell_ccf: pd.DataFrame,
-    region_list: list[str]
+    region_list: list[str],
+    max_workers: int | None = 1,
 ) -> tuple[DictDataFrame, DictDataFrame, DictDataFrame]:
     #
     region_ctx_ccf = {}
     region_frac_ccf = {}
     region_cell_ccf = {}
     # Columns
-    ei_cols = [PARCELLATION_SUBSTRUCTURE, "E", "I", "O"]
-    sel_cols = ei_cols + GABA_COLUMNS + GLUT_COLUMNS
-    #
-    for region in region_list:
-        # Select the CCF meta data specific to the above region
-        region_df = cell_ccf.loc[cell_ccf[PARCELLATION_STRUCTURE] == region]
-        # Ignore the regions for which no cells are available
-        if len(region_df) == 0:
-            continue
-        # 1. Flags corresponding to meta data
-        region_df = region_df.copy()
-        region_df = cell_meta_type_flags(region_df)
-        # 2. Group by sub structure and find summary counts for each layer
-        region_ei_df = region_df[sel_cols].copy()
-        region_ei_ctx = region_ei_df.groupby(PARCELLATION_SUBSTRUCTURE).sum()
-        region_ei_ctx["T"] = (
-            region_ei_ctx["E"] + region_ei_ctx["I"] + region_ei_ctx["O"]
-        )  # type:ignore
-        region_ei_ctx["EI"] = region_ei_ctx["E"] + region_ei_ctx["I"]  # type: ignore
+    count_cols = ["E", "I", "O"] + GABA_COLUMNS + GLUT_COLUMNS
+    # 1. Flags corresponding to meta data, for all the selected regions at once
+    #    (unless cell_ccf is already flagged, see cached_cell_ccf_meta)
+    flag_df = cell_ccf.loc[cell_ccf[PARCELLATION_STRUCTURE].isin(region_list)]
+    if not set(TYPE_FLAG_COLUMNS).issubset(flag_df.columns):
+        flag_df = cell_meta_type_flags(flag_df)
+    # 2. Group by structure and sub structure to find summary counts for
+    #    each layer of all the regions in one aggregation
+    agg_df = flag_df.groupby(
+        [PARCELLATION_STRUCTURE, PARCELLATION_SUBSTRUCTURE], observed=True
+    )[count_cols].sum()
+    agg_df["T"] = agg_df["E"] + agg_df["I"] + agg_df["O"]
+    agg_df["EI"] = agg_df["E"] + agg_df["I"]
+    # Regions with at least one cell, and the row positions of each region
+    present_regions = set(agg_df.index.unique(level=0))
+    region_rows = flag_df.groupby(
+        PARCELLATION_STRUCTURE, sort=False, observed=True
+    ).indices
+
+    def region_cell_types(
+        region: str
+    ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        region_df = flag_df.take(region_rows[region])
+        region_ei_ctx = agg_df.xs(region)
         n_region_layers = len(region_df)
         region_name = region
         # 3. Compute the ratios
@@ -1011,6 +1596,19 @@ def region_ccf_cell_types(
             region_name,
             n_region_layers
         )
+        return region_df, region_ei_ctx, region_ei_ratio
+    # Ignore the regions for which no cells are available; the regions are
+    # independent, and with max_workers != 1 are processed in a thread pool
+    # (the per-region work is small and mostly holds the GIL, so serial is
+    # the default)
+    regions = [(region,) for region in region_list if region in present_regions]
+    if max_workers == 1:
+        region_results = [region_cell_types(*rx) for rx in regions]
+    else:
+        region_results = _thread_map(region_cell_types, regions, max_workers)
+    for (region,), (region_df, region_ei_ctx, region_ei_ratio) in zip(
+        regions, region_results
+    ):
         # Save to the data frame to the dict
         region_cell_ccf[region] = region_df
         region_ctx_ccf[region] = region_ei_ctx
@@ -1018,6 +1616,70 @@ def region_ccf_cell_types(
     return region_cell_ccf, region_ctx_ccf, region_frac_ccf
 
 
+def region_ccf_type_ratios_duckdb(
+    ccf_meta_file: str | Path,
+    region_list: list[str]
+) -> DictDataFrame:
+    """
+    Cell type ratios of the regions in region_list, same as the third output
+    of region_ccf_cell_types, with the scan of the CCF meta file done in
+    DuckDB.
+
+    DuckDB reads the file and counts the cells of each (structure,
+    substructure, class, subclass) combination of the selected regions;
+    only these counts are flagged and summed in pandas, weighted by the
+    number of cells.
+    """
+    def qcol(col_name: str) -> str:
+        return '"' + col_name.replace('"', '""') + '"'
+    #
+    group_cols = ", ".join(qcol(cx) for cx in CCF_TYPE_COLUMNS)
+    # Scan the parquet copy of the CSV when there is an up-to-date one,
+    # preferring the one with only the CCF_TYPE_COLUMNS
+    pq_path = (
+        _parquet_sidecar(ccf_meta_file, columns=CCF_TYPE_COLUMNS)
+        or _parquet_sidecar(ccf_meta_file)
+    )
+    if pq_path is not None:
+        ccf_meta_file, read_fn = pq_path, "read_parquet"
+    else:
+        read_fn = "read_csv"
+    count_query = (
+        f"SELECT {group_cols}, count(*) AS ncells "
+        f"FROM {read_fn}(?) "
+        f"WHERE list_contains(?, {qcol(PARCELLATION_STRUCTURE)}) "
+        f"GROUP BY {group_cols}"
+    )
+    with duckdb.connect() as db_conn:
+        type_count_df = db_conn.execute(
+            count_query, [str(ccf_meta_file), list(region_list)]
+        ).df()
+    ncells = type_count_df["ncells"]
+    flag_df = cell_meta_type_flags(type_count_df)
+    count_df = flag_df[TYPE_FLAG_COLUMNS].mul(ncells, axis=0)
+    count_df[PARCELLATION_STRUCTURE] = type_count_df[PARCELLATION_STRUCTURE]
+    count_df[PARCELLATION_SUBSTRUCTURE] = type_count_df[PARCELLATION_SUBSTRUCTURE]
+    agg_df = count_df.groupby(
+        [PARCELLATION_STRUCTURE, PARCELLATION_SUBSTRUCTURE]
+    ).sum()
+    agg_df["T"] = agg_df["E"] + agg_df["I"] + agg_df["O"]
+    agg_df["EI"] = agg_df["E"] + agg_df["I"]
+    region_ncells = ncells.groupby(type_count_df[PARCELLATION_STRUCTURE]).sum()
+    # Regions with at least one cell
+    present_regions = set(agg_df.index.unique(level=0))
+    #
+    region_frac_ccf = {}
+    for region in region_list:
+        if region not in present_regions:
+            continue
+        region_frac_ccf[region] = cell_meta_type_ratios(
+            agg_df.xs(region),
+            region,
+            int(region_ncells[region])
+        )
+    return region_frac_ccf
+
+
 def region_cell_type_ratios(
     region_name: str,
     download_base: str,
@@ -1028,7 +1690,7 @@ def region_cell_type_ratios(
     ccf_meta_file = abc_cache_download_meta(download_base, merfish_ccf_data_key,
                                             parcel_meta_data_key)
     if ccf_meta_file:
-        cell_ccf = cell_ccf_meta(ccf_meta_file)
+        cell_ccf = cached_cell_ccf_meta(ccf_meta_file)
         _, _, region_frac_ccf = region_ccf_cell_types(cell_ccf, [region_name])
         return region_frac_ccf[region_name]
 
@@ -1038,6 +1700,7 @@ class InitParams(CerebrumBaseModel):
 
 class ExecParams(CerebrumBaseModel):
     region  : t.Annotated[list[str] , Field(title="List of Regions")]
+    use_duckdb : t.Annotated[bool, Field(title="Aggregate with DuckDB")] = False
 
 CCFParamsBase : t.TypeAlias = BaseParams[InitParams,  ExecParams] 
 
@@ -1046,6 +1709,9 @@ class ABCDbMERFISH_CCFQuery(DbQuery[InitParams, ExecParams]):
         init_params: t.Annotated[InitParams, Field(title='Init Params')]
         exec_params: t.Annotated[ExecParams, Field(title='Exec Params')]
 
+    # Seconds for which a refreshed manifest is reused
+    _MANIFEST_TTL : float = 3600
+
     def __init__(self, init_params: InitParams, **params: t.Any):
         """
         Initialize MERFISH Query
@@ -1057,11 +1723,16 @@ class ABCDbMERFISH_CCFQuery(DbQuery[InitParams, ExecParams]):
         """
         self.name : str = __name__ + ".ABCDbMERFISHQuery"
         self.download_base : str = init_params.download_base # params["download_base"]
-        self.pcache : AbcProjectCache = AbcProjectCache.from_s3_cache(
-            self.download_base
-        )
-        self.pcache.load_latest_manifest()
-        self.pcache.get_directory_metadata(MERFISH_CCF_DATASET_KEY)
+        self.pcache : AbcProjectCache = _get_pcache(self.download_base)
+        # Skip the manifest/meta data refresh if it was done recently; the
+        # time is kept per cache object, so a rebuilt cache (after
+        # _load_pcache.cache_clear() or eviction) is always refreshed
+        now = time.time()
+        last_refresh = _PCACHE_REFRESH.get(self.pcache, 0.0)
+        if now - last_refresh > self._MANIFEST_TTL:
+            self.pcache.load_latest_manifest()
+            self.pcache.get_directory_metadata(MERFISH_CCF_DATASET_KEY)
+            _PCACHE_REFRESH[self.pcache] = now
         self.ccf_meta_file : Path = self.pcache.get_metadata_path(
             MERFISH_CCF_DATASET_KEY, PARCEL_META_DATA_KEY
         )
@@ -1082,6 +1753,8 @@ class ABCDbMERFISH_CCFQuery(DbQuery[InitParams, ExecParams]):
         run_params: dict with the following keys:
             region : List[str]
              lis of regions of interest
+            use_duckdb : bool (default: False)
+             count the cells of the regions with DuckDB instead of pandas
         Returns
         -------
         dict of elements for each sub-region:
@@ -1095,8 +1768,15 @@ class ABCDbMERFISH_CCFQuery(DbQuery[InitParams, ExecParams]):
         _log().info("ABCDbMERFISH_CCFQuery Args : %s", str(exec_params))
         region_list =  exec_params.region # rarg["region"]
         #
-        mfish_ccf_df = pd.read_csv(self.ccf_meta_file)
-        _, _, region_frac_map = region_ccf_cell_types(mfish_ccf_df, region_list)
+        if exec_params.use_duckdb:
+            region_frac_map = region_ccf_type_ratios_duckdb(
+                self.ccf_meta_file, region_list
+            )
+        else:
+            mfish_ccf_df = cached_cell_ccf_meta(self.ccf_meta_file)
+            _, _, region_frac_map = region_ccf_cell_types(
+                mfish_ccf_df, region_list
+            )
         return [
             {rx: rdf.to_dict(orient="index") for rx, rdf in region_frac_map.items()}
         ]
@@ -1113,23 +1793,18 @@ class ABCDbMERFISH_CCFQuery(DbQuery[InitParams, ExecParams]):
 
 
 class DFBuilder:
-    @staticmethod
-    def has_sub_region(region_dct: dict[str, t.Any]) -> bool:
-        return any(
-            isinstance(subregion_dct, collections.abc.Mapping)
-            for subregion_dct in region_dct.values()
-        )
-
     @staticmethod
     def qry2dict(
         in_iter: QryItr,
     ) -> list[dict[str, t.Any]]:
         subr_stats = []
         for qry_result in in_iter:
-            for _rx, region_dct in qry_result.items():
-                if DFBuilder.has_sub_region(region_dct):
-                    for subregion_dct in region_dct.values():
-                        subr_stats.append(subregion_dct)
+            for region_dct in qry_result.values():
+                # Query output comes from to_dict(orient="index"), so the
+                # regions with sub-regions have plain dicts as their values
+                first_value = next(iter(region_dct.values()), None)
+                if type(first_value) is dict:
+                    subr_stats.extend(region_dct.values())
                 else:
                     subr_stats.append(region_dct)
         return subr_stats
@@ -1141,7 +1816,20 @@ class DFBuilder:
     ) -> pl.DataFrame | None:
         if in_iter is None:
             return None
-        return pl.DataFrame(DFBuilder.qry2dict(in_iter))
+        subr_stats = DFBuilder.qry2dict(in_iter)
+        # Rows of the cell type ratios have a known schema; infer otherwise
+        if subr_stats and subr_stats[0].keys() == DF_SCHEMA.keys():
+            return pl.from_dicts(subr_stats, schema=DF_SCHEMA)
+        return pl.DataFrame(subr_stats)
+
+    @staticmethod
+    def build_arrow(
+        in_iter: QryItr | None,
+        **_params: t.Any,
+    ) -> pa.Table | None:
+        if in_iter is None:
+            return None
+        return pa.Table.from_pylist(DFBuilder.qry2dict(in_iter))
 
 
 class ABCDuckDBWriter(QryDBWriter):
@@ -1154,8 +1842,27 @@ class ABCDuckDBWriter(QryDBWriter):
         in_iter: QryItr | None,
         **_params: t.Any,
     ) -> None:
-        result_df = DFBuilder.build(in_iter) # pyright: ignore[reportUnusedVariable]
-        self.conn.execute(
-            "CREATE OR REPLACE TABLE abm_mouse AS SELECT * FROM result_df"
-        )
-        self.conn.commit()
+        # Arrow table is scanned by DuckDB without an intermediate data frame
+        self.conn.register("result_df", DFBuilder.build_arrow(in_iter))
+        try:
+            # Replace the rows of the regions in result_df, keeping the rows
+            # of the other regions, in a single transaction
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS abm_mouse AS "
+                    "SELECT * FROM result_df LIMIT 0"
+                )
+                self.conn.execute(
+                    "DELETE FROM abm_mouse WHERE \"Region\" IN "
+                    "(SELECT DISTINCT \"Region\" FROM result_df)"
+                )
+                self.conn.execute(
+                    "INSERT INTO abm_mouse BY NAME SELECT * FROM result_df"
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        finally:
+            self.conn.unregister("result_df")